@@ -12,6 +12,12 @@ class HomeAssistantButtonSettings(QFormLayout):
         self.domain: None | QComboBox = None
         self.entity: None | QComboBox = None
         self.service: None | QComboBox = None
+        self.entities: None | QLineEdit = None
+        self.areas: None | QLineEdit = None
+        self.devices: None | QLineEdit = None
+        self.service_data: None | QLineEdit = None
+        self.repeat: None | QCheckBox = None
+        self.icon_rules: None | QLineEdit = None
         self.hass = hass
 
         icon = QIcon()
@@ -36,12 +42,69 @@ class HomeAssistantButtonSettings(QFormLayout):
         self.service = QComboBox(parent)
         self.service.setEnabled(False)
 
+        label_entities = QLabel(parent)
+        label_entities.setText("Additional entities")
+
+        self.entities = QLineEdit(parent)
+        self.entities.setPlaceholderText("light.kitchen, switch.fan")
+        self.entities.setText(old_settings.get("entities", ""))
+
+        label_areas = QLabel(parent)
+        label_areas.setText("Areas")
+
+        self.areas = QLineEdit(parent)
+        self.areas.setPlaceholderText("living_room, kitchen")
+        self.areas.setText(old_settings.get("areas", ""))
+
+        label_devices = QLabel(parent)
+        label_devices.setText("Devices")
+
+        self.devices = QLineEdit(parent)
+        self.devices.setText(old_settings.get("devices", ""))
+
+        label_service_data = QLabel(parent)
+        label_service_data.setText("Service data")
+
+        self.service_data = QLineEdit(parent)
+        self.service_data.setPlaceholderText('{"brightness_step_pct": 10}')
+        self.service_data.setText(old_settings.get("service_data", ""))
+
+        label_repeat = QLabel(parent)
+        label_repeat.setText("Repeat on hold")
+
+        self.repeat = QCheckBox(parent)
+        self.repeat.setChecked(old_settings.get("repeat", False))
+        self.repeat.setToolTip(
+            "Presses while the button is held are sent together, at most every 0.1 s. "
+            "Media player volume up/down is sent as one volume set in steps of 10 %, "
+            "whatever the volume step of the device is."
+        )
+
+        label_icon_rules = QLabel(parent)
+        label_icon_rules.setText("Icon rules")
+
+        self.icon_rules = QLineEdit(parent)
+        self.icon_rules.setPlaceholderText('[{"attribute": "brightness", "max": 255, "gradient": ["#bebebe", "#eeff1b"]}]')
+        self.icon_rules.setText(old_settings.get("icon_rules", ""))
+
         self.setWidget(0, QFormLayout.LabelRole, label_domain)
         self.setWidget(0, QFormLayout.FieldRole, self.domain)
         self.setWidget(1, QFormLayout.LabelRole, label_entity)
         self.setWidget(1, QFormLayout.FieldRole, self.entity)
         self.setWidget(2, QFormLayout.LabelRole, label_service)
         self.setWidget(2, QFormLayout.FieldRole, self.service)
+        self.setWidget(3, QFormLayout.LabelRole, label_entities)
+        self.setWidget(3, QFormLayout.FieldRole, self.entities)
+        self.setWidget(4, QFormLayout.LabelRole, label_areas)
+        self.setWidget(4, QFormLayout.FieldRole, self.areas)
+        self.setWidget(5, QFormLayout.LabelRole, label_devices)
+        self.setWidget(5, QFormLayout.FieldRole, self.devices)
+        self.setWidget(6, QFormLayout.LabelRole, label_service_data)
+        self.setWidget(6, QFormLayout.FieldRole, self.service_data)
+        self.setWidget(7, QFormLayout.LabelRole, label_repeat)
+        self.setWidget(7, QFormLayout.FieldRole, self.repeat)
+        self.setWidget(8, QFormLayout.LabelRole, label_icon_rules)
+        self.setWidget(8, QFormLayout.FieldRole, self.icon_rules)
 
         old_domain = old_settings.get("domain", "")
 
@@ -102,4 +165,10 @@ class HomeAssistantButtonSettings(QFormLayout):
             "domain": self.domain.currentText(),
             "entity": self.entity.currentText(),
             "service": self.service.currentText(),
+            "entities": self.entities.text(),
+            "areas": self.areas.text(),
+            "devices": self.devices.text(),
+            "service_data": self.service_data.text(),
+            "repeat": self.repeat.isChecked(),
+            "icon_rules": self.icon_rules.text(),
         }
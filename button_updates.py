@@ -0,0 +1,49 @@
+from typing import Dict, Tuple
+
+from streamdeck_ui.api import StreamDeckServer
+
+from .tracing import TRACER
+
+
+class ButtonUpdates:
+    def __init__(self, api: StreamDeckServer):
+        self._api = api
+        self._updates: Dict[Tuple[str, int, int], Dict[str, str]] = {}
+
+    def set_button_icon(self, deck_id: str, page_id: int, button_id: int, icon: str) -> None:
+        self._updates.setdefault((deck_id, page_id, button_id), {})["icon"] = icon
+
+    def set_button_text(self, deck_id: str, page_id: int, button_id: int, text: str) -> None:
+        self._updates.setdefault((deck_id, page_id, button_id), {})["text"] = text
+
+    def commit(self) -> None:
+        updates, self._updates = self._updates, {}
+
+        changed = False
+
+        # grouped by deck and page; a button updated several times is only set once, with its last value
+        for (deck_id, page_id, button_id), update in sorted(updates.items()):
+            if "icon" in update and self._is_changed("get_button_icon", deck_id, page_id, button_id, update["icon"]):
+                with TRACER.span("set_button_icon", deck=deck_id, page=page_id, button=button_id):
+                    self._api.set_button_icon(deck_id, page_id, button_id, update["icon"])
+
+                changed = True
+
+            if "text" in update and self._is_changed("get_button_text", deck_id, page_id, button_id, update["text"]):
+                with TRACER.span("set_button_text", deck=deck_id, page=page_id, button=button_id):
+                    self._api.set_button_text(deck_id, page_id, button_id, update["text"])
+
+                changed = True
+
+        if changed:
+            with TRACER.span("gui_redraw_buttons"):
+                self._api.gui_redraw_buttons()
+
+    def _is_changed(self, getter: str, deck_id: str, page_id: int, button_id: int, value: str) -> bool:
+        # keys are only re-rendered on the deck if their content changed, if the host lets us read it
+        get_value = getattr(self._api, getter, None)
+
+        if not get_value:
+            return True
+
+        return get_value(deck_id, page_id, button_id) != value
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import time
+from logging import getLogger
+from threading import Thread
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+_LOGGER = getLogger(__name__)
+
+# time given to running tasks to finish before they are cancelled on stop()
+DRAIN_TIMEOUT = 2
+
+
+class EventLoop:
+    def __init__(self, use_uvloop: bool = True):
+        self._use_uvloop = use_uvloop
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: Thread | None = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop | None:
+        return self._loop
+
+    @property
+    def is_uvloop(self) -> bool:
+        return uvloop is not None and self._use_uvloop
+
+    def is_running(self) -> bool:
+        return self._loop is not None and self._loop.is_running()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        if self.is_running():
+            return self._loop
+
+        self._loop = uvloop.new_event_loop() if self.is_uvloop else asyncio.new_event_loop()
+
+        self._thread = Thread(target=self._run, name="home-assistant-event-loop", daemon=True)
+        self._thread.start()
+
+        # wait until run_forever() is active, so callers can use the loop right away
+        started = asyncio.run_coroutine_threadsafe(asyncio.sleep(0), self._loop)
+        started.result()
+
+        return self._loop
+
+    def _run(self) -> None:
+        # the loop belongs to this thread only, the caller's (GUI) thread keeps its own event loop setting
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def stop(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        if not self.is_running():
+            return
+
+        try:
+            self.run(self._async_drain(timeout))
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+
+    async def _async_drain(self, timeout: float) -> None:
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+
+            for task in pending:
+                task.cancel()
+
+            if pending:
+                _LOGGER.warning(f"Cancelled {len(pending)} tasks still running after {timeout}s")
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        await self._loop.shutdown_asyncgens()
+
+
+def _benchmark(use_uvloop: bool, events: int = 200000) -> float:
+    # Home Assistant like state events over a local socket, parsed on the receiving side
+    event_loop = EventLoop(use_uvloop)
+    event_loop.start()
+
+    message = json.dumps({"id": 1, "type": "event", "event": {"variables": {"trigger": {"to_state": {
+        "entity_id": "light.kitchen", "state": "on", "attributes": {"brightness": 255}}}}}}).encode() + b"\n"
+
+    async def send(_, writer: asyncio.StreamWriter) -> None:
+        for _ in range(events):
+            writer.write(message)
+            await writer.drain()
+
+        writer.close()
+
+    async def receive() -> float:
+        server = await asyncio.start_server(send, "127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname())
+
+        start = time.perf_counter()
+
+        for _ in range(events):
+            json.loads(await reader.readline())
+
+        elapsed = time.perf_counter() - start
+
+        writer.close()
+        server.close()
+        await server.wait_closed()
+
+        return elapsed
+
+    elapsed = event_loop.run(receive())
+    event_loop.stop()
+
+    return events / elapsed
+
+
+if __name__ == "__main__":
+    print(f"asyncio: {_benchmark(False):,.0f} events/s")
+
+    if uvloop:
+        print(f"uvloop: {_benchmark(True):,.0f} events/s")
+    else:
+        print("uvloop: not installed")
@@ -1,10 +1,11 @@
 import asyncio
+import atexit
+import hashlib
 import json
 import os
 from asyncio import Task, sleep
 from logging import getLogger
-from threading import Thread
-from typing import Dict
+from typing import Dict, List
 
 import websockets
 from websockets.exceptions import ConnectionClosedError, ConnectionClosedOK
@@ -12,6 +13,13 @@ from websockets.exceptions import ConnectionClosedError, ConnectionClosedOK
 from streamdeck_ui.api import StreamDeckServer
 from streamdeck_ui.config import PROJECT_PATH
 
+from .button_updates import ButtonUpdates
+from .event_loop import DRAIN_TIMEOUT, EventLoop
+from .icon_cache import ICON_CACHE
+from .icon_rules import COLOR_OFF, DEFAULT_TEXT, MODE_ICON, CompiledRules, compile_rules, parse_rules, render_text
+from .tracing import TRACER, timestamp_to_trace_time
+from .traffic import TrafficCounter, get_extensions
+
 _LOGGER = getLogger(__name__)
 
 HASS_WEBSOCKET_API = "/api/websocket?latest"
@@ -20,6 +28,8 @@ FIELD_EVENT = "event"
 
 MDI_SVG_JSON = "plugins/home-assistant/mdi-svg.json"
 ENTITY_ID = "entity_id"
+AREA_ID = "area_id"
+DEVICE_ID = "device_id"
 ID = "id"
 
 FIELD_TYPE = "type"
@@ -27,28 +37,62 @@ FIELD_SUCCESS = "success"
 
 ICON_SCALE = 0.66
 
-COLOR_ON = "#eeff1b"
-COLOR_OFF = "#bebebe"
-
 MDI_TRANSFORM = 'fill="<color>" transform="translate(4.5, 5) scale(<scale>)"'
 
 MDI_DEFAULT_PATH = "M7,2V13H10V22L17,10H13L17,2H7Z"
 
+# icons persisted with another transform or scale are not reused
+ICON_CACHE_SIGNATURE = f"{MDI_TRANSFORM}|{ICON_SCALE}"
+
 BUTTON_ENCODE_SYMBOL = "-"
 
 RECV_LOOP_TIMEOUT = 300
 
+# outgoing messages are sent in this order, messages of the same priority in the order they were queued
+PRIORITY_INTERACTIVE = 0
+PRIORITY_VISIBLE = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_VISIBLE: "visible",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# minimum time between two coalesced sends of a held button
+REPEAT_INTERVAL = 0.1
+
+# settings applied within this time are reconciled together, e.g. when a page or profile is imported
+RECONCILE_DELAY = 0.05
+
+# subscription_id of an entity whose subscribe message is not sent yet; message ids start at 1
+SUBSCRIPTION_PENDING = 0
+
+# volume change per press of a held media_player volume_up/volume_down; the device's own step size is not known
+VOLUME_STEP = 0.1
+
+# a requested volume level wins over the reported one for at most this long, in case the device never reports it exactly
+VOLUME_REQUEST_TIMEOUT = 5
+
 BUTTON_ENTITIES: Dict[str, str] = {}
 
 
 class HomeAssistant:
     def __init__(self):
         self._api = None
+        self._button_updates: ButtonUpdates | None = None
         self._websocket = None
         self._entity_change_trigger_websocket = None
         self._message_id: int = 0
+        self._event_loop = EventLoop()
         self._loop = None
-        self._recv_task: Task
+        self._recv_task: Task | None = None
+        self._send_task: Task | None = None
+        self._send_queue = asyncio.PriorityQueue()
+        self._send_sequence: int = 0
+        self._send_stats: Dict[int, dict] = {
+            priority: {"depth": 0, "sent": 0, "total_wait": 0.0, "max_wait": 0.0} for priority in PRIORITY_NAMES
+        }
         self._domains = []
         self._entities = {}
         self._services = {}
@@ -56,10 +100,30 @@ class HomeAssistant:
         self._port: str = ""
         self._token: str = ""
         self._ssl: bool = True
-        self._event_loop_thread = None
+        self._compression: bool = True
+        self._compression_level: int = -1
+        self._traffic: Dict[str, TrafficCounter] = {}
+        self._trace_file: str = ""
+        self._icon_cache_file: str = ""
+        self._recv_lock = asyncio.Lock()
+        self._reconcile_lock = asyncio.Lock()
+        self._responses: Dict[int, str] = {}
+        self._repeated_presses: Dict[str, dict] = {}
+        self._repeat_last_sent: Dict[str, float] = {}
+        self._requested_volume_levels: Dict[str, tuple] = {}
+        self._button_rules: Dict[str, CompiledRules] = {}
+        self._button_settings: Dict[str, Dict[str, str]] = {}
+        self._pending_button_settings: Dict[str, Dict[str, str]] = {}
+        self._tasks: set = set()
 
         filename = os.path.join(PROJECT_PATH, MDI_SVG_JSON)
-        self._mdi_icons = json.loads(open(filename, "r").read())
+        mdi_svg = open(filename, "rb").read()
+        self._mdi_icons = json.loads(mdi_svg)
+
+        # nor icons built from another version of the icon set
+        self._icon_cache_signature = f"{ICON_CACHE_SIGNATURE}|{hashlib.sha256(mdi_svg).hexdigest()}"
+
+        atexit.register(self._export_trace)
 
     def apply_settings(self, settings: Dict[str, str]):
         if not settings:
@@ -73,12 +137,38 @@ class HomeAssistant:
         self._token = settings.get("token")
         self._port = settings.get("port")
         self._ssl = settings.get("ssl")
+        self._compression = settings.get("compression", True)
+
+        try:
+            self._compression_level = int(settings.get("compression_level") or -1)
+        except ValueError:
+            self._compression_level = None
+
+        if self._compression_level not in range(-1, 10):
+            # zlib would only reject it during the handshake, with a generic connection error
+            _LOGGER.error(f"Compression level must be between -1 (default) and 9, "
+                          f"not {settings.get('compression_level')}; using the default")
+            self._compression_level = -1
 
+        # disconnect() writes the trace recorded so far to the previous trace file
         self.disconnect()
+
+        self._trace_file = settings.get("trace_file", "")
+        self._icon_cache_file = settings.get("icon_cache_file", "")
+
+        if self._icon_cache_file:
+            ICON_CACHE.load(self._icon_cache_file, self._icon_cache_signature)
+
+        if self._trace_file:
+            TRACER.enable()
+        else:
+            TRACER.disable()
+
         self.connect()
 
     def _set_api(self, api: StreamDeckServer):
         self._api = api
+        self._button_updates = ButtonUpdates(api)
 
     def connect(self) -> bool:
         if self.is_connected():
@@ -88,13 +178,18 @@ class HomeAssistant:
         if not self._url or not self._token or not self._port:
             return False
 
-        if not self._loop or not self._loop.is_running():
-            self._loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self._loop)
+        if not self._event_loop.is_running():
+            self._loop = self._event_loop.start()
 
-            self._event_loop_thread = Thread(target=self._loop.run_forever)
-            self._event_loop_thread.daemon = True
-            self._event_loop_thread.start()
+            # queues and locks are bound to the loop they are first used on
+            self._send_queue = asyncio.PriorityQueue()
+            self._recv_lock = asyncio.Lock()
+            self._reconcile_lock = asyncio.Lock()
+            self._responses = {}
+            self._repeated_presses = {}
+            self._requested_volume_levels = {}
+            self._pending_button_settings = {}
+            self._tasks = set()
 
         # without result() connection might not have been established before first call to websocket
         return asyncio.run_coroutine_threadsafe(self._async_connect(), self._loop).result()
@@ -112,12 +207,14 @@ class HomeAssistant:
             # close existing websocket
             await self._entity_change_trigger_websocket.close()
 
-        self._websocket = await self._async_auth()
+        self._traffic["commands"] = TrafficCounter()
+        self._websocket = await self._async_auth(self._traffic["commands"])
 
         if not self._websocket:
             return False
 
-        self._entity_change_trigger_websocket = await self._async_auth()
+        self._traffic["events"] = TrafficCounter()
+        self._entity_change_trigger_websocket = await self._async_auth(self._traffic["events"])
 
         is_connected: bool = await self._async_is_connected()
 
@@ -125,37 +222,86 @@ class HomeAssistant:
             print("Connected to Home Assistant")
             self._recv_task = asyncio.create_task(self._async_run_recv_loop())
 
+            if not self._send_task or self._send_task.done():
+                self._send_task = asyncio.create_task(self._async_run_send_loop())
+
         return is_connected
 
     def disconnect(self) -> None:
+        self._export_trace()
+
+        if not self._event_loop.is_running():
+            return
+
+        self._event_loop.run(self._async_disconnect())
+
+        # only after the websockets are closed, their own background tasks would hold up the drain otherwise
+        self._event_loop.stop()
+        self._loop = None
+
+    async def _async_disconnect(self) -> None:
+        # let presses and requests which are still in flight finish before the connection goes away
+        in_flight = [task for task in self._tasks if not task.done() and task is not asyncio.current_task()]
+
+        if in_flight:
+            await asyncio.wait(in_flight, timeout=DRAIN_TIMEOUT)
+
+        if self._recv_task and not self._recv_task.done():
+            self._recv_task.cancel()
+
         if self._websocket and not self._websocket.closed:
-            asyncio.run_coroutine_threadsafe(self._websocket.close(), self._loop).result()
+            await self._websocket.close()
 
         if self._entity_change_trigger_websocket and not self._entity_change_trigger_websocket.closed:
-            self._recv_task.cancel()
-            asyncio.run_coroutine_threadsafe(self._entity_change_trigger_websocket.close(), self._loop).result()
+            await self._entity_change_trigger_websocket.close()
+
+        if self._send_task and not self._send_task.done():
+            self._send_task.cancel()
+
+    def _create_task(self, coroutine) -> Task:
+        # tasks of the plugin itself, disconnect() lets them finish
+        task = self._loop.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
 
-        if self._loop and not self._loop.is_running():
-            self._loop.close()
+        return task
 
-    async def _async_auth(self):
+    async def _async_tracked(self, coroutine):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+
+        try:
+            return await coroutine
+        finally:
+            self._tasks.discard(task)
+
+    async def _async_auth(self, traffic: TrafficCounter):
         websocket = None
 
         websocket_url = f'{"wss://" if self._ssl else "ws://"}{self._url}:{self._port}{HASS_WEBSOCKET_API}'
 
         try:
-            websocket = await websockets.connect(websocket_url, open_timeout=5)
+            websocket = await websockets.connect(
+                websocket_url,
+                open_timeout=5,
+                compression=None,
+                extensions=get_extensions(traffic, self._compression, self._compression_level),
+            )
 
             auth_required = await asyncio.wait_for(websocket.recv(), timeout=5)
+            traffic.count_received(auth_required)
             auth_required = _get_field_from_message(auth_required, FIELD_TYPE)
 
             if not auth_required:
                 _LOGGER.error("Could not auth with Home Assistant")
                 return
 
-            await websocket.send(json.dumps({FIELD_TYPE: "auth", "access_token": self._token}))
+            auth = json.dumps({FIELD_TYPE: "auth", "access_token": self._token})
+            traffic.count_sent(auth)
+            await websocket.send(auth)
 
             auth_ok = await asyncio.wait_for(websocket.recv(), timeout=5)
+            traffic.count_received(auth_ok)
             auth_ok = _get_field_from_message(auth_ok, FIELD_TYPE)
 
             if not auth_ok or "auth_ok" != auth_ok:
@@ -184,102 +330,145 @@ class HomeAssistant:
                 _LOGGER.info("Connection closed; quitting recv() loop.")
                 break
 
-            message_type = _get_field_from_message(message, FIELD_TYPE)
+            self._traffic["events"].count_received(message)
 
-            if FIELD_EVENT == message_type:
-                new_state = (
-                    json.loads(message).get(FIELD_EVENT, {}).get("variables", {}).get("trigger", {}).get("to_state", {})
-                )
+            with TRACER.span("parse", size=len(message)):
+                try:
+                    parsed = json.loads(message)
+                except json.JSONDecodeError:
+                    _LOGGER.error(f"Could not parse {message}")
+                    continue
+
+            if FIELD_EVENT == parsed.get(FIELD_TYPE):
+                new_state = parsed.get(FIELD_EVENT, {}).get("variables", {}).get("trigger", {}).get("to_state", {})
 
                 entity_id = new_state.get(ENTITY_ID)
 
-                domain = entity_id.split(".")[0]
+                last_updated = timestamp_to_trace_time(new_state.get("last_updated"))
 
-                entity_settings = self._entities[domain].get(entity_id)
+                if last_updated:
+                    # Home Assistant and the network, as far as the clocks of both machines agree
+                    TRACER.add_span("home_assistant", last_updated, entity_id=entity_id)
 
-                buttons = entity_settings.get("buttons")
+                try:
+                    with TRACER.span("event", entity_id=entity_id):
+                        domain = entity_id.split(".")[0]
 
-                for button_string in buttons:
-                    deck_id, page_id, button_id = _decode_deck_id_page_button(button_string)
+                        entity_settings = self._entities[domain].get(entity_id)
+
+                        entity_settings["state"] = new_state.get("state", "off")
+                        entity_settings["attributes"] = new_state.get("attributes", {})
 
-                    button_settings = self._api.get_button_plugin_settings(deck_id, page_id, button_id,
-                                                                           "home-assistant")
+                        self._update_requested_volume_level(entity_id, entity_settings["attributes"])
 
-                    service = button_settings.get("service", "")
+                        buttons = entity_settings.get("buttons")
 
-                    state = new_state.get("state")
+                        for button_string in buttons:
+                            with TRACER.span("lookup", button=button_string):
+                                deck_id, page_id, button_id = _decode_deck_id_page_button(button_string)
 
-                    unit_of_measurement = new_state.get("attributes", {}).get("unit_of_measurement", "")
+                                rules = self._button_rules.get(button_string)
 
-                    if unit_of_measurement:
-                        unit_of_measurement = f"\n{unit_of_measurement}"
+                                if not rules:
+                                    button_settings = self._api.get_button_plugin_settings(
+                                        deck_id, page_id, button_id, "home-assistant"
+                                    )
 
-                    domain = entity_id.split(".")[0]
+                                    rules = self._compile_button_rules(button_string, domain, button_settings)
 
-                    if self.is_button_icon(state, domain):
-                        icon = await self._async_get_icon(entity_id, service, new_state.get("state"))
+                            with TRACER.span("render", button=button_string):
+                                self._render_button(deck_id, page_id, button_id, entity_id, rules,
+                                                    new_state.get("state"), new_state.get("attributes", {}))
 
-                        self._api.set_button_icon(deck_id, page_id, button_id, icon)
-                    else:
-                        self._api.set_button_text(deck_id, page_id, button_id, f"{state}{unit_of_measurement}")
+                        # all buttons showing this entity are redrawn at once
+                        self._button_updates.commit()
+                except Exception:
+                    # one broken button must not stop the updates of all others
+                    _LOGGER.exception(f"Error updating buttons for {entity_id}")
 
-                    self._api.gui_redraw_buttons()
+                TRACER.end_presses(entity_id)
 
         await self._websocket.close()
-        self._loop.stop()
 
     def get_icon(self, entity_id: str, service: str, state: str = "") -> str:
-        if not self.connect():
+        if not self.connect() or not entity_id:
             return ""
 
-        return asyncio.run_coroutine_threadsafe(self._async_get_icon(entity_id, service, state), self._loop).result()
+        domain = entity_id.split(".")[0]
 
-    async def _async_get_icon(self, entity_id: str, service: str, state: str) -> str:
-        if not entity_id:
-            return ""
+        entity = self._entities.get(domain, {}).get(entity_id, {})
 
-        domain = entity_id.split(".")[0]
+        appearance = compile_rules(domain, service).resolve(state, entity.get("attributes", {}))
 
-        if "media_player" == domain:
-            # use icons for service instead of entity
-            if "media_play_pause" == service:
-                if "playing" == state:
-                    icon_name = "pause"
-                else:
-                    icon_name = "play"
-            elif "media_stop" == service:
-                icon_name = "stop"
-            elif "volume_up" == service:
-                icon_name = "volume-plus"
-            elif "volume_down" == service:
-                icon_name = "entity_id, volume-minus"
-            elif "media_next_track" == service:
-                icon_name = "skip-next"
-            elif "media_previous_track" == service:
-                icon_name = "skip-previous"
-            else:
-                _LOGGER.warning(f"Icon not found for domain {domain} and service {service}")
-                icon_name = "alert-circle"
+        return self._build_icon(entity_id, appearance.get("icon") or entity.get("icon", "None"),
+                                appearance.get("color", COLOR_OFF))
 
-            icon = self._get_icon_svg(entity_id, icon_name)
+    def _build_icon(self, entity_id: str, icon_name: str, color: str) -> str:
+        icon_name = icon_name.replace("mdi:", "")
 
-            color = COLOR_ON
-        else:
-            # use icon of entity
-            domain = entity_id.split(".")[0]
+        return ICON_CACHE.get(
+            icon_name,
+            color,
+            lambda: self._get_icon_svg(entity_id, icon_name)
+            .replace("<path", f"<path {MDI_TRANSFORM}")
+            .replace("<scale>", str(ICON_SCALE))
+            .replace("<color>", color),
+        )
 
-            entity = self._entities[domain].get(entity_id)
+    async def _async_prewarm_icons(self) -> None:
+        # build every icon the configured buttons can show, so state changes and page switches find them ready
+        for button_string, rules in list(self._button_rules.items()):
+            entity_id = BUTTON_ENTITIES.get(button_string)
 
-            icon_text = entity.get("icon", "None")
-            icon = self._get_icon_svg(entity_id, icon_text)
+            if not entity_id:
+                continue
 
-            color = COLOR_ON if "on" == state else COLOR_OFF
+            entity = self._entities.get(entity_id.split(".")[0], {}).get(entity_id, {})
 
-        return (
-            icon.replace("<path", f"<path {MDI_TRANSFORM}")
-            .replace("<scale>", str(ICON_SCALE))
-            .replace("<color>", color)
-        )
+            for appearance in rules.get_appearances():
+                if MODE_ICON == appearance.get("mode"):
+                    self._build_icon(entity_id, appearance.get("icon") or entity.get("icon") or "None",
+                                     appearance.get("color", COLOR_OFF))
+
+            # do not hold up events while warming up
+            await sleep(0)
+
+        if self._icon_cache_file and ICON_CACHE.modified:
+            # the file can be large, do not block the event loop writing it
+            await self._loop.run_in_executor(None, ICON_CACHE.save, self._icon_cache_file, self._icon_cache_signature)
+
+    def _compile_button_rules(self, button_string: str, domain: str, button_settings: Dict[str, str]) -> CompiledRules:
+        rules = compile_rules(domain, button_settings.get("service", ""),
+                              parse_rules(button_settings.get("icon_rules", "")))
+
+        self._button_rules[button_string] = rules
+
+        return rules
+
+    def _render_button(self, deck_id: str, page_id: int, button_id: int, entity_id: str, rules: CompiledRules,
+                       state: str, attributes: dict) -> None:
+        appearance = rules.resolve(state, attributes)
+
+        if MODE_ICON == appearance.get("mode"):
+            domain = entity_id.split(".")[0]
+
+            # use the icon of the entity unless a rule sets one
+            icon_name = (
+                appearance.get("icon")
+                or attributes.get("icon")
+                or self._entities.get(domain, {}).get(entity_id, {}).get("icon")
+                or "None"
+            )
+
+            icon = self._build_icon(entity_id, icon_name, appearance.get("color", COLOR_OFF))
+            text = render_text(appearance["text"], state, attributes) if "text" in appearance else ""
+
+            self._button_updates.set_button_icon(deck_id, page_id, button_id, icon)
+            self._button_updates.set_button_text(deck_id, page_id, button_id, text)
+        else:
+            self._button_updates.set_button_icon(deck_id, page_id, button_id, "")
+            self._button_updates.set_button_text(deck_id, page_id, button_id,
+                                                 render_text(appearance.get("text", DEFAULT_TEXT), state, attributes))
 
     def get_state(self, entity_id: str) -> dict:
         if not self.connect():
@@ -287,26 +476,25 @@ class HomeAssistant:
 
         return asyncio.run_coroutine_threadsafe(self._async_get_state(entity_id), self._loop).result()
 
-    async def _async_get_state(self, entity_id: str) -> dict:
-        message = self.create_message("get_states")
+    async def _async_get_state(self, entity_id: str, priority: int = PRIORITY_INTERACTIVE) -> dict:
+        states = await self._async_get_states(priority)
+
+        return states.get(entity_id, {"state": "off"})
 
-        message_id: int = message[ID]
+    async def _async_get_states(self, priority: int) -> Dict[str, dict]:
+        message = self.create_message("get_states")
 
-        await self._websocket.send(json.dumps(message))
+        message_id: int = await self._async_send(self._websocket, message, priority)
 
         response = await self._wait_for_response(message_id)
 
         success = _get_field_from_message(response, FIELD_SUCCESS)
 
         if not success:
-            _LOGGER.error(f"Error retrieving state for {entity_id}.")
-            return {"state": "off"}
-
-        for entity in _get_field_from_message(response, "result"):
-            if entity.get(ENTITY_ID, "") == entity_id:
-                return entity
+            _LOGGER.error("Error retrieving states.")
+            return {}
 
-        return {"state": "off"}
+        return {entity.get(ENTITY_ID, ""): entity for entity in _get_field_from_message(response, "result")}
 
     def get_domains(self) -> list:
         if not self.connect():
@@ -342,9 +530,7 @@ class HomeAssistant:
     async def _load_domains_and_entities(self) -> None:
         message = self.create_message("get_states")
 
-        message_id: int = message[ID]
-
-        await self._websocket.send(json.dumps(message))
+        message_id: int = await self._async_send(self._websocket, message, PRIORITY_BACKGROUND)
 
         response = await self._wait_for_response(message_id)
 
@@ -371,6 +557,7 @@ class HomeAssistant:
             self._entities[domain][entity_id] = {
                 "state": entity.get("state", "off"),
                 "icon": entity.get("attributes", {}).get("icon", ""),
+                "attributes": entity.get("attributes", {}),
                 "buttons": [],
                 "subscription_id": -1,
             }
@@ -390,9 +577,7 @@ class HomeAssistant:
 
         message = self.create_message("get_services")
 
-        message_id: int = message[ID]
-
-        await self._websocket.send(json.dumps(message))
+        message_id: int = await self._async_send(self._websocket, message, PRIORITY_BACKGROUND)
 
         response = await self._wait_for_response(message_id)
 
@@ -411,34 +596,258 @@ class HomeAssistant:
 
         return self._services.get(domain, [])
 
-    def call_service(self, entity_id: str, service: str) -> None:
-        if not self.connect():
+    def press_button(self, button_settings: Dict[str, str]) -> None:
+        calls = get_service_calls(button_settings)
+
+        if not calls or not self.connect():
             return
 
-        asyncio.run_coroutine_threadsafe(self._async_call_service(entity_id, service), self._loop).result()
+        # only subscribed entities send state events which could end the press
+        press_id = TRACER.start_press(
+            [
+                entity_id
+                for call in calls
+                for entity_id in call["target"].get(ENTITY_ID, [])
+                if self._entities.get(entity_id.split(".")[0], {}).get(entity_id, {}).get("subscription_id", -1) > -1
+            ],
+            service=button_settings.get("service"),
+        )
 
-    async def _async_call_service(self, entity_id: str, service: str) -> None:
-        domain = entity_id.split(".")[0]
+        if not button_settings.get("repeat"):
+            self.call_services(calls, press_id)
+            return
 
-        message = self.create_message("call_service")
-        message["domain"] = domain
-        message["service"] = service
-        message["target"] = {ENTITY_ID: entity_id}
+        # held buttons are not sent one by one; presses are summed up and sent at most every REPEAT_INTERVAL
+        key = json.dumps(button_settings, sort_keys=True)
+        self._loop.call_soon_threadsafe(self._queue_repeated_press, key, calls, press_id)
 
-        message_id: int = message[ID]
+    def _queue_repeated_press(self, key: str, calls: List[dict], press_id: int) -> None:
+        presses = self._repeated_presses.get(key)
 
-        await self._websocket.send(json.dumps(message))
+        if presses:
+            presses["count"] += 1
+            presses["press_ids"].append(press_id)
+            return
 
-        response = await self._wait_for_response(message_id)
+        self._repeated_presses[key] = {"calls": calls, "count": 1, "press_ids": [press_id]}
+        self._create_task(self._async_send_repeated_presses(key))
 
-        success = _get_field_from_message(response, FIELD_SUCCESS)
+    async def _async_send_repeated_presses(self, key: str) -> None:
+        delay = self._repeat_last_sent.get(key, 0) + REPEAT_INTERVAL - self._loop.time()
 
-        if not success:
-            _LOGGER.error(f"Error toggling entity: {entity_id}.")
+        if delay > 0:
+            await sleep(delay)
+
+        presses = self._repeated_presses.pop(key)
+        self._repeat_last_sent[key] = self._loop.time()
+
+        await self._async_call_services(self._coalesce_calls(presses["calls"], presses["count"]), presses["press_ids"])
+
+    def _coalesce_calls(self, calls: List[dict], count: int) -> List[dict]:
+        coalesced = []
+
+        for call in calls:
+            service_data = call.get("service_data") or {}
+
+            if "media_player" == call["domain"] and call["service"] in ["volume_up", "volume_down"]:
+                coalesced.extend(self._coalesce_volume_calls(call, count))
+            elif any(_is_step_field(field, value) for field, value in service_data.items()):
+                coalesced.append({
+                    **call,
+                    "service_data": {
+                        field: value * count if _is_step_field(field, value) else value
+                        for field, value in service_data.items()
+                    },
+                })
+            else:
+                # no delta to sum up (e.g. toggle), every press is sent, otherwise the end state could differ
+                coalesced.extend([call] * count)
+
+        return coalesced
+
+    def _coalesce_volume_calls(self, call: dict, count: int) -> List[dict]:
+        # volume_set is used even for a single press, so a held button never mixes in the device's own step size
+        step = VOLUME_STEP * count if "volume_up" == call["service"] else -VOLUME_STEP * count
+
+        calls = []
+
+        for entity_id in call["target"].get(ENTITY_ID, []):
+            volume_level = self._get_volume_level(entity_id)
+
+            if volume_level is None:
+                # current volume not known for sure, fall back to repeating the original call
+                calls.extend([{**call, "target": {ENTITY_ID: [entity_id]}}] * count)
+                continue
+
+            volume_level = round(min(1.0, max(0.0, volume_level + step)), 2)
+
+            # state events of earlier batches may still be on their way, they must not reset the level
+            self._requested_volume_levels[entity_id] = (volume_level, self._loop.time())
+
+            calls.append({
+                "domain": "media_player",
+                "service": "volume_set",
+                "target": {ENTITY_ID: [entity_id]},
+                "service_data": {"volume_level": volume_level},
+            })
+
+        other_targets = {field: value for field, value in call["target"].items() if ENTITY_ID != field}
+
+        if other_targets:
+            calls.extend([{**call, "target": other_targets}] * count)
+
+        return calls
+
+    def _get_volume_level(self, entity_id: str) -> float | None:
+        entity = self._entities.get("media_player", {}).get(entity_id, {})
+
+        if entity.get("subscription_id", -1) <= SUBSCRIPTION_PENDING:
+            # without state events the known level may be long outdated, e.g. changed with the remote
+            return None
+
+        requested = self._requested_volume_levels.get(entity_id)
+
+        if requested and self._loop.time() - requested[1] < VOLUME_REQUEST_TIMEOUT:
+            return requested[0]
+
+        volume_level = entity.get("attributes", {}).get("volume_level")
+
+        return volume_level if _is_number(volume_level) else None
+
+    def _update_requested_volume_level(self, entity_id: str, attributes: dict) -> None:
+        requested = self._requested_volume_levels.get(entity_id)
+        volume_level = attributes.get("volume_level")
+
+        if requested and _is_number(volume_level) and round(volume_level, 2) == requested[0]:
+            # the device caught up, its own state is the one to follow again
+            del self._requested_volume_levels[entity_id]
+
+    def call_service(self, domain: str, service: str, target: dict, service_data: dict = None) -> None:
+        self.call_services([{"domain": domain, "service": service, "target": target, "service_data": service_data}])
+
+    def call_services(self, calls: List[dict], press_id: int = 0) -> None:
+        if not calls or not self.connect():
+            return
+
+        asyncio.run_coroutine_threadsafe(
+            self._async_tracked(self._async_call_services(calls, [press_id])), self._loop
+        ).result()
+
+    async def _async_call_services(self, calls: List[dict], press_ids: List[int] = ()) -> None:
+        messages = {}
+
+        # send all calls before waiting for any result, so a batch costs a single round trip
+        for call in calls:
+            message = self.create_message("call_service")
+            message["domain"] = call["domain"]
+            message["service"] = call["service"]
+            message["target"] = call["target"]
+
+            if call.get("service_data"):
+                message["service_data"] = call["service_data"]
+
+            messages[await self._async_send(self._websocket, message, PRIORITY_INTERACTIVE)] = message
+
+        for press_id in press_ids:
+            TRACER.press_step(press_id, "call_service")
+
+        responses = await self._wait_for_responses(list(messages.keys()))
+
+        for press_id in press_ids:
+            TRACER.press_step(press_id, "ack")
+            TRACER.ack_press(press_id)
+
+        for message_id, message in messages.items():
+            success = _get_field_from_message(responses.get(message_id, "{}"), FIELD_SUCCESS)
+
+            if not success:
+                _LOGGER.error(f"Error calling service {message['domain']}.{message['service']} "
+                              f"for target {message['target']}.")
+
+    async def _async_send(self, websocket, message: dict, priority: int) -> int:
+        if not self._send_task or self._send_task.done() or not websocket or websocket.closed:
+            # nobody would ever send the message, do not let the caller wait for it
+            raise ConnectionError("Not connected to Home Assistant")
+
+        sent = self._loop.create_future()
+
+        self._send_sequence += 1
+        self._send_queue.put_nowait((priority, self._send_sequence, websocket, message, self._loop.time(), sent))
+        self._send_stats[priority]["depth"] += 1
+
+        # the id the message was sent with, its response carries the same id
+        return await sent
+
+    async def _async_run_send_loop(self) -> None:
+        try:
+            while True:
+                priority, _, websocket, message, queued_at, sent = await self._send_queue.get()
+
+                wait = self._loop.time() - queued_at
+
+                stats = self._send_stats[priority]
+                stats["depth"] -= 1
+                stats["sent"] += 1
+                stats["total_wait"] += wait
+                stats["max_wait"] = max(stats["max_wait"], wait)
+
+                if sent.done():
+                    # the sender is not interested any more
+                    continue
+
+                # ids are assigned in the order messages go out, Home Assistant rejects an id lower than the last one
+                self._message_id += 1
+                message[ID] = self._message_id
+                payload = json.dumps(message)
+
+                try:
+                    self._get_traffic_counter(websocket).count_sent(payload)
+                    await websocket.send(payload)
+                    sent.set_result(message[ID])
+                except Exception as exception:
+                    sent.set_exception(exception)
+        finally:
+            # fail everything still queued, otherwise the senders would wait forever
+            while not self._send_queue.empty():
+                priority, _, _, _, _, sent = self._send_queue.get_nowait()
+                self._send_stats[priority]["depth"] -= 1
+
+                if not sent.done():
+                    sent.set_exception(ConnectionError("Connection to Home Assistant closed"))
+
+    def get_send_queue_stats(self) -> Dict[str, dict]:
+        return {
+            PRIORITY_NAMES[priority]: {
+                "depth": stats["depth"],
+                "sent": stats["sent"],
+                "average_wait": stats["total_wait"] / stats["sent"] if stats["sent"] else 0.0,
+                "max_wait": stats["max_wait"],
+            }
+            for priority, stats in self._send_stats.items()
+        }
+
+    def _get_traffic_counter(self, websocket) -> TrafficCounter:
+        if websocket is self._entity_change_trigger_websocket:
+            return self._traffic["events"]
+
+        return self._traffic["commands"]
+
+    def _export_trace(self) -> None:
+        if self._trace_file and TRACER.enabled:
+            TRACER.export(self._trace_file)
+
+    def get_traffic_stats(self) -> Dict[str, dict]:
+        return {connection: traffic.get_stats() for connection, traffic in self._traffic.items()}
+
+    def _get_button_priority(self, deck_id: str, page_id: int) -> int:
+        if self._api and self._api.get_page(deck_id) == page_id:
+            return PRIORITY_VISIBLE
+
+        return PRIORITY_BACKGROUND
 
     def create_message(self, message_type: str) -> dict:
-        self._message_id += 1
-        return {ID: self._message_id, FIELD_TYPE: message_type}
+        # the id is set when the message is sent, see _async_run_send_loop
+        return {FIELD_TYPE: message_type}
 
     def add_tracked_entity(self, entity_id: str, deck_id: str, page: int, button: int) -> None:
         if not self.connect():
@@ -475,14 +884,7 @@ class HomeAssistant:
             # already subscribed to entity events
             return
 
-        message = self.create_message("subscribe_trigger")
-        message["trigger"] = {"platform": "state", ENTITY_ID: entity_id}
-
-        message_id = message.get(ID)
-
-        await self._entity_change_trigger_websocket.send(json.dumps(message))
-
-        entity_settings["subscription_id"] = message_id
+        await self._async_subscribe(entity_id, entity_settings, self._get_button_priority(deck_id, page))
 
     def remove_tracked_entity(self, entity_id: str, deck_id: str, page: int, button: int) -> None:
         if not self.connect():
@@ -506,10 +908,29 @@ class HomeAssistant:
             # the entity is still attached to another button, so keep the trigger subscription
             return
 
+        await self._async_unsubscribe(entity_settings)
+
+    async def _async_subscribe(self, entity_id: str, entity_settings: dict, priority: int) -> None:
+        message = self.create_message("subscribe_trigger")
+        message["trigger"] = {"platform": "state", ENTITY_ID: entity_id}
+
+        # nobody else subscribes the entity while the message is waiting to be sent
+        entity_settings["subscription_id"] = SUBSCRIPTION_PENDING
+
+        try:
+            entity_settings["subscription_id"] = await self._async_send(
+                self._entity_change_trigger_websocket, message, priority
+            )
+        except Exception:
+            entity_settings["subscription_id"] = -1
+            raise
+
+    async def _async_unsubscribe(self, entity_settings: dict) -> None:
+        # subscriptions live on the connection they were made on; Home Assistant expects the id as "subscription"
         message = self.create_message("unsubscribe_events")
-        message["subscription_id"] = entity_settings["subscription_id"]
+        message["subscription"] = entity_settings["subscription_id"]
 
-        await self._entity_change_trigger_websocket.send(json.dumps(message))
+        await self._async_send(self._entity_change_trigger_websocket, message, PRIORITY_BACKGROUND)
 
         entity_settings["subscription_id"] = -1
 
@@ -552,26 +973,48 @@ class HomeAssistant:
         return f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24"><title>{name}</title><path d="{path}" /></svg>'
 
     async def _wait_for_response(self, message_id: int) -> str:
+        responses = await self._wait_for_responses([message_id])
+
+        return responses[message_id]
+
+    async def _wait_for_responses(self, message_ids: List[int]) -> Dict[int, str]:
+        responses = {}
+
         while True:
-            response = await asyncio.wait_for(self._websocket.recv(), timeout=5)
-            response_id = _get_field_from_message(response, ID)
+            for message_id in message_ids:
+                if message_id in self._responses:
+                    responses[message_id] = self._responses.pop(message_id)
 
-            if message_id == response_id:
-                break
+            if len(responses) == len(message_ids):
+                return responses
 
-        return response
+            # only one coroutine may read from the websocket, responses for others are handed over via _responses
+            async with self._recv_lock:
+                if any(message_id in self._responses for message_id in message_ids):
+                    continue
 
-    def is_button_icon(self, state: str, domain: str) -> bool:
-        return state in ["on", "off", "unavailable"] or domain in ["media_player"]
+                response = await asyncio.wait_for(self._websocket.recv(), timeout=5)
+                self._traffic["commands"].count_received(response)
+                self._responses[_get_field_from_message(response, ID)] = response
 
     def initialize(self, api: StreamDeckServer, settings: Dict[str, str]) -> None:
         self._set_api(api)
         self.apply_settings(settings)
+
+        if not self.connect():
+            _LOGGER.error("Not connected to Home Assistant, buttons are not initialized.")
+            return
+
         asyncio.run_coroutine_threadsafe(self._async_initialize(), self._loop).result()
 
     async def _async_initialize(self) -> None:
+        if not await self._async_is_connected():
+            return
+
         await self._load_domains_and_entities()
 
+        desired: Dict[str, Dict[str, str]] = {}
+
         # listen for events for entities associated with buttons and update icons
         for deck_id, deck in self._api.state.items():
             count = 0
@@ -584,69 +1027,142 @@ class HomeAssistant:
                 continue
 
             for page_id, page in deck.buttons.items():
-                for multi_button_id, multi_button in page.items():
-                    for _, button in multi_button.states.items():
-                        button_settings = self._api.get_button_plugin_settings(deck_id, page_id, multi_button_id,
-                                                                               "home-assistant")
+                for button_id in page.keys():
+                    button_string = _encode_deck_id_page_button(deck_id, page_id, button_id)
+                    desired[button_string] = dict(
+                        self._api.get_button_plugin_settings(deck_id, page_id, button_id, "home-assistant") or {}
+                    )
 
-                        await self._apply_button_settings(deck_id, page_id, multi_button_id, button_settings)
+        try:
+            await self._async_reconcile(desired)
+        except Exception:
+            _LOGGER.exception("Error initializing buttons")
 
     def apply_button_settings(self, deck_id: str, page_id: int, button_id: int, button_settings: Dict[str, str]) -> None:
-        asyncio.run_coroutine_threadsafe(self._apply_button_settings(deck_id, page_id, button_id, button_settings), self._loop).result()
+        if not self._loop or not self._loop.is_running():
+            return
+
+        button_string = _encode_deck_id_page_button(deck_id, page_id, button_id)
+        self._loop.call_soon_threadsafe(self._queue_button_settings, button_string, dict(button_settings or {}))
+
+    def _queue_button_settings(self, button_string: str, button_settings: Dict[str, str]) -> None:
+        if not self._pending_button_settings:
+            self._loop.call_later(RECONCILE_DELAY, lambda: self._create_task(self._async_reconcile_pending()))
+
+        self._pending_button_settings[button_string] = button_settings
 
-    async def _apply_button_settings(self, deck_id: str, page_id: int, button_id: int, button_settings: Dict[str, str]) -> None:
+    async def _async_reconcile_pending(self) -> None:
+        desired, self._pending_button_settings = self._pending_button_settings, {}
+
+        try:
+            await self._async_reconcile(desired)
+        except Exception:
+            _LOGGER.exception("Error applying button settings")
+
+    async def _async_reconcile(self, desired: Dict[str, Dict[str, str]]) -> None:
+        # one at a time, overlapping reconciles could both subscribe the same entity
+        async with self._reconcile_lock:
+            try:
+                await self._async_reconcile_buttons(desired)
+            except Exception:
+                # forget these settings, so the next reconcile applies them again instead of skipping them
+                for button_string in desired:
+                    self._button_settings.pop(button_string, None)
+
+                raise
+
+    async def _async_reconcile_buttons(self, desired: Dict[str, Dict[str, str]]) -> None:
         global BUTTON_ENTITIES
 
-        # listen for events for entities associated with buttons and update icons
-        button_string = _encode_deck_id_page_button(deck_id, page_id, button_id)
+        if not self._entities:
+            await self._load_domains_and_entities()
 
-        if not button_settings.get("domain") or not button_settings.get("entity"):
-            old_entity = BUTTON_ENTITIES.get(button_string)
+        changed_entities = set()
+        renders: Dict[str, str] = {}
 
-            if old_entity:
-                # this button had an entity set but it was removed - delete icon and text
-                self._api.set_button_icon(deck_id, page_id, button_id, "")
-                self._api.set_button_text(deck_id, page_id, button_id, "")
-                self._api.gui_redraw_buttons()
-                BUTTON_ENTITIES.pop(button_string)
+        for button_string, button_settings in desired.items():
+            if self._button_settings.get(button_string) == button_settings and button_string in self._button_rules:
+                # nothing changed for this button
+                continue
 
-            return
+            entity_id = button_settings.get("entity", "") if button_settings.get("domain") else ""
 
-        entity_id = button_settings["entity"]
+            if entity_id and not self._entities.get(entity_id.split(".")[0], {}).get(entity_id):
+                # entity does not exist (any more)
+                entity_id = ""
 
-        domain = button_settings["domain"]
+            old_entity_id = BUTTON_ENTITIES.get(button_string, "")
 
-        entity_settings = self._entities[domain].get(entity_id)
+            if old_entity_id and old_entity_id != entity_id:
+                old_entity = self._entities.get(old_entity_id.split(".")[0], {}).get(old_entity_id)
 
-        if not entity_settings:
-            # entity does not exist (any more)
-            return
+                if old_entity and button_string in old_entity["buttons"]:
+                    old_entity["buttons"].remove(button_string)
+                    changed_entities.add(old_entity_id)
 
-        BUTTON_ENTITIES[button_string] = entity_id
+            if not entity_id:
+                self._button_settings.pop(button_string, None)
+                self._button_rules.pop(button_string, None)
 
-        await self._async_add_tracked_entity(entity_id, deck_id, page_id, button_id)
+                if old_entity_id:
+                    # this button had an entity set but it was removed - delete icon and text
+                    deck_id, page_id, button_id = _decode_deck_id_page_button(button_string)
+                    self._button_updates.set_button_icon(deck_id, page_id, button_id, "")
+                    self._button_updates.set_button_text(deck_id, page_id, button_id, "")
+                    BUTTON_ENTITIES.pop(button_string)
 
-        service = button_settings["service"]
+                continue
 
-        entity_state = await self._async_get_state(entity_id)
+            entity = self._entities[entity_id.split(".")[0]][entity_id]
 
-        state = entity_state.get("state")
+            if button_string not in entity["buttons"]:
+                entity["buttons"].append(button_string)
 
-        unit_of_measurement = entity_state.get("attributes", {}).get("unit_of_measurement", "")
+            # also when the button was already registered, an earlier subscribe may have failed
+            changed_entities.add(entity_id)
 
-        if unit_of_measurement:
-            unit_of_measurement = f"\n{unit_of_measurement}"
+            BUTTON_ENTITIES[button_string] = entity_id
+            self._button_settings[button_string] = button_settings
+            self._compile_button_rules(button_string, entity_id.split(".")[0], button_settings)
 
-        if self.is_button_icon(state, domain):
-            icon = await self._async_get_icon(entity_id, service, state)
+            renders[button_string] = entity_id
 
-            self._api.set_button_icon(deck_id, page_id, button_id, icon)
-            self._api.set_button_text(deck_id, page_id, button_id, "")
-        else:
-            self._api.set_button_icon(deck_id, page_id, button_id, "")
-            self._api.set_button_text(deck_id, page_id, button_id, f"{state}{unit_of_measurement}")
+        # subscription changes are sent without waiting for each other
+        subscriptions = []
+        newly_subscribed = set()
+
+        for entity_id in changed_entities:
+            entity = self._entities[entity_id.split(".")[0]][entity_id]
+
+            if entity["buttons"] and entity["subscription_id"] == -1:
+                deck_id, page_id, _ = _decode_deck_id_page_button(entity["buttons"][0])
+                subscriptions.append(self._async_subscribe(entity_id, entity, self._get_button_priority(deck_id, page_id)))
+                newly_subscribed.add(entity_id)
+            elif not entity["buttons"] and entity["subscription_id"] > -1:
+                subscriptions.append(self._async_unsubscribe(entity))
+
+        await asyncio.gather(*subscriptions)
 
-        self._api.gui_redraw_buttons()
+        if any(entity_id in newly_subscribed for entity_id in renders.values()):
+            # one state fetch for all newly subscribed entities, the others are kept up to date by their events
+            for entity_id, entity_state in (await self._async_get_states(PRIORITY_VISIBLE)).items():
+                entity = self._entities.get(entity_id.split(".")[0], {}).get(entity_id)
+
+                if entity:
+                    entity["state"] = entity_state.get("state", "off")
+                    entity["attributes"] = entity_state.get("attributes", {})
+
+        for button_string, entity_id in renders.items():
+            deck_id, page_id, button_id = _decode_deck_id_page_button(button_string)
+            entity = self._entities[entity_id.split(".")[0]][entity_id]
+
+            self._render_button(deck_id, page_id, button_id, entity_id, self._button_rules[button_string],
+                                entity["state"], entity.get("attributes", {}))
+
+        self._button_updates.commit()
+
+        if renders:
+            self._create_task(self._async_prewarm_icons())
 
 
 def _encode_deck_id_page_button(deck_id: str, page: int, button: int) -> str:
@@ -658,6 +1174,85 @@ def _decode_deck_id_page_button(encoded: str):
     return values[0], int(values[1]), int(values[2])
 
 
+def get_service_calls(button_settings: Dict[str, str]) -> List[dict]:
+    domain = button_settings.get("domain", "")
+    service = button_settings.get("service", "")
+
+    if not domain or not service:
+        return []
+
+    service_data = _parse_service_data(button_settings.get("service_data", ""))
+
+    # entities are grouped by their own domain, so one button can switch e.g. lights and switches together
+    targets: Dict[str, dict] = {}
+
+    for entity_id in [button_settings.get("entity", "")] + _split_list(button_settings.get("entities", "")):
+        if not entity_id:
+            continue
+
+        target = targets.setdefault(entity_id.split(".")[0], {})
+        entity_ids = target.setdefault(ENTITY_ID, [])
+
+        if entity_id not in entity_ids:
+            entity_ids.append(entity_id)
+
+    areas = _split_list(button_settings.get("areas", ""))
+    devices = _split_list(button_settings.get("devices", ""))
+
+    if areas:
+        targets.setdefault(domain, {})[AREA_ID] = areas
+
+    if devices:
+        targets.setdefault(domain, {})[DEVICE_ID] = devices
+
+    calls = []
+
+    for target_domain, target in targets.items():
+        if domain == target_domain:
+            calls.append({"domain": domain, "service": service, "target": target, "service_data": service_data})
+            continue
+
+        # service data is only valid for the service of the button's domain, other domains would reject it
+        if service_data:
+            _LOGGER.warning(f"Not sending service data to {target[ENTITY_ID]}, it only applies to {domain}.{service}")
+
+        calls.append({"domain": target_domain, "service": service, "target": target, "service_data": {}})
+
+    return calls
+
+
+def _is_step_field(field: str, value) -> bool:
+    return "step" in field and _is_number(value)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _split_list(value: str) -> List[str]:
+    if not value:
+        return []
+
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _parse_service_data(value: str) -> dict:
+    if not value:
+        return {}
+
+    try:
+        service_data = json.loads(value)
+    except json.JSONDecodeError:
+        _LOGGER.error(f"Could not parse service data {value}")
+        return {}
+
+    if not isinstance(service_data, dict):
+        _LOGGER.error(f"Service data must be a JSON object: {value}")
+        return {}
+
+    return service_data
+
+
 def _get_field_from_message(message: str, field: str):
     try:
         parsed = json.loads(message)
@@ -13,6 +13,10 @@ class HomeAssistantSettings(QFormLayout):
         self.token: None | QLineEdit = None
         self.port: None | QLineEdit = None
         self.ssl: None | QCheckBox = None
+        self.compression: None | QCheckBox = None
+        self.compression_level: None | QLineEdit = None
+        self.trace_file: None | QLineEdit = None
+        self.icon_cache_file: None | QLineEdit = None
 
         icon = QIcon()
         icon.addFile(":/icons/icons/gear.png", QSize(), QIcon.Normal, QIcon.Off)
@@ -42,6 +46,33 @@ class HomeAssistantSettings(QFormLayout):
         self.ssl = QCheckBox(parent)
         self.ssl.setChecked(old_settings.get("ssl", True))
 
+        label_compression = QLabel(parent)
+        label_compression.setText("Compression")
+
+        self.compression = QCheckBox(parent)
+        self.compression.setChecked(old_settings.get("compression", True))
+
+        label_compression_level = QLabel(parent)
+        label_compression_level.setText("Compression level")
+
+        self.compression_level = QLineEdit(parent)
+        self.compression_level.setPlaceholderText("-1 (default), 0 (none), 1 (fast) - 9 (small); empty for default")
+        self.compression_level.setText(old_settings.get("compression_level", ""))
+
+        label_trace_file = QLabel(parent)
+        label_trace_file.setText("Trace file")
+
+        self.trace_file = QLineEdit(parent)
+        self.trace_file.setPlaceholderText("empty to disable, e.g. ~/streamdeck-trace.json")
+        self.trace_file.setText(old_settings.get("trace_file", ""))
+
+        label_icon_cache_file = QLabel(parent)
+        label_icon_cache_file.setText("Icon cache file")
+
+        self.icon_cache_file = QLineEdit(parent)
+        self.icon_cache_file.setPlaceholderText("empty to keep icons in memory only")
+        self.icon_cache_file.setText(old_settings.get("icon_cache_file", ""))
+
         self.setWidget(0, QFormLayout.LabelRole, label_url)
         self.setWidget(0, QFormLayout.FieldRole, self.url)
         self.setWidget(1, QFormLayout.LabelRole, label_token)
@@ -50,6 +81,14 @@ class HomeAssistantSettings(QFormLayout):
         self.setWidget(2, QFormLayout.FieldRole, self.port)
         self.setWidget(3, QFormLayout.LabelRole, label_ssl)
         self.setWidget(3, QFormLayout.FieldRole, self.ssl)
+        self.setWidget(4, QFormLayout.LabelRole, label_compression)
+        self.setWidget(4, QFormLayout.FieldRole, self.compression)
+        self.setWidget(5, QFormLayout.LabelRole, label_compression_level)
+        self.setWidget(5, QFormLayout.FieldRole, self.compression_level)
+        self.setWidget(6, QFormLayout.LabelRole, label_trace_file)
+        self.setWidget(6, QFormLayout.FieldRole, self.trace_file)
+        self.setWidget(7, QFormLayout.LabelRole, label_icon_cache_file)
+        self.setWidget(7, QFormLayout.FieldRole, self.icon_cache_file)
 
     def get_settings(self) -> Dict[str, str]:
         return {
@@ -57,4 +96,8 @@ class HomeAssistantSettings(QFormLayout):
             "token": self.token.text(),
             "port": self.port.text(),
             "ssl": self.ssl.isChecked(),
+            "compression": self.compression.isChecked(),
+            "compression_level": self.compression_level.text(),
+            "trace_file": self.trace_file.text(),
+            "icon_cache_file": self.icon_cache_file.text(),
         }
@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+from logging import getLogger
+from typing import Callable, Dict
+
+_LOGGER = getLogger(__name__)
+
+# upper bound for the number of cached icons; icons beyond it are built every time
+MAX_CACHED_ICONS = 4096
+
+
+class IconCache:
+    def __init__(self):
+        self._icons: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        # icons were added since the cache was last loaded or saved
+        self.modified: bool = False
+
+    def get(self, icon_name: str, color: str, build: Callable[[], str]) -> str:
+        key = f"{icon_name}|{color}"
+
+        icon = self._icons.get(key)
+
+        if icon is not None:
+            return icon
+
+        icon = build()
+
+        with self._lock:
+            if len(self._icons) < MAX_CACHED_ICONS:
+                # all buttons showing the same icon share one string, on every deck
+                icon = self._icons.setdefault(key, icon)
+                self.modified = True
+
+        return icon
+
+    def __len__(self) -> int:
+        return len(self._icons)
+
+    def load(self, filename: str, signature: str) -> None:
+        filename = os.path.expanduser(filename)
+
+        if not os.path.exists(filename):
+            return
+
+        try:
+            with open(filename, "r") as file:
+                content = json.load(file)
+        except (OSError, json.JSONDecodeError) as error:
+            _LOGGER.error(f"Could not read icon cache {filename}: {error}")
+            return
+
+        if content.get("signature") != signature:
+            # the icons were built with another template, they would look different now
+            return
+
+        with self._lock:
+            for key, icon in content.get("icons", {}).items():
+                if len(self._icons) >= MAX_CACHED_ICONS:
+                    break
+
+                self._icons.setdefault(key, icon)
+
+    def save(self, filename: str, signature: str) -> None:
+        with self._lock:
+            icons = dict(self._icons)
+            self.modified = False
+
+        try:
+            with open(os.path.expanduser(filename), "w") as file:
+                json.dump({"signature": signature, "icons": icons}, file)
+        except OSError as error:
+            _LOGGER.error(f"Could not write icon cache {filename}: {error}")
+
+
+ICON_CACHE = IconCache()
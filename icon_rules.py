@@ -0,0 +1,285 @@
+import json
+import re
+from bisect import bisect_right
+from logging import getLogger
+from typing import Dict, List
+
+_LOGGER = getLogger(__name__)
+
+COLOR_ON = "#eeff1b"
+COLOR_OFF = "#bebebe"
+
+MODE_ICON = "icon"
+MODE_TEXT = "text"
+
+OUTPUT_FIELDS = ("mode", "icon", "color", "text")
+
+DEFAULT_TEXT = "{state}{unit}"
+
+GRADIENT_STEPS = 32
+
+HEX_COLOR = re.compile(r"#?([0-9a-fA-F]{3}|[0-9a-fA-F]{6})")
+
+# Rules are checked in order, the first rule that matches and sets a field decides that field.
+# Conditions: "service", "state" and "attribute" together with "below" (exclusive) or "gradient".
+# Outputs: "mode" (icon or text), "icon" (mdi name), "color" and "text" (format string, see render_text).
+# Button rules come first, then the rules of the entity's domain, then the rules for all domains ("*").
+# Matching attribute rules are applied on top of the result for the state.
+DEFAULT_RULES: Dict[str, List[dict]] = {
+    "media_player": [
+        {"service": "media_play_pause", "state": "playing", "icon": "pause"},
+        {"service": "media_play_pause", "icon": "play"},
+        {"service": "media_stop", "icon": "stop"},
+        {"service": "volume_up", "icon": "volume-plus"},
+        {"service": "volume_down", "icon": "volume-minus"},
+        {"service": "media_next_track", "icon": "skip-next"},
+        {"service": "media_previous_track", "icon": "skip-previous"},
+        {"icon": "alert-circle"},
+        {"mode": MODE_ICON, "color": COLOR_ON},
+    ],
+    "*": [
+        {"state": "on", "mode": MODE_ICON, "color": COLOR_ON},
+        {"state": "off", "mode": MODE_ICON},
+        {"state": "unavailable", "mode": MODE_ICON},
+        {"mode": MODE_TEXT, "color": COLOR_OFF},
+    ],
+}
+
+
+class CompiledRules:
+    def __init__(self, states: Dict[str, dict], default: dict, attribute_rules: List[dict]):
+        self._states = states
+        self._default = default
+        self._attribute_rules = attribute_rules
+
+    def resolve(self, state: str, attributes: dict) -> dict:
+        appearance = self._states.get(state, self._default)
+
+        if not self._attribute_rules:
+            return appearance
+
+        appearance = dict(appearance)
+        decided = set()
+
+        for rule in self._attribute_rules:
+            if rule["state"] is not None and rule["state"] != state:
+                continue
+
+            value = attributes.get(rule["attribute"])
+
+            if not _is_number(value):
+                continue
+
+            if "colors" in rule:
+                position = (value - rule["min"]) / (rule["max"] - rule["min"]) if rule["max"] != rule["min"] else 1
+                step = min(GRADIENT_STEPS - 1, max(0, int(position * (GRADIENT_STEPS - 1))))
+                outputs = {"color": rule["colors"][step]}
+            else:
+                index = bisect_right(rule["thresholds"], value)
+
+                if index == len(rule["outputs"]):
+                    continue
+
+                outputs = rule["outputs"][index]
+
+            for field, output in outputs.items():
+                if field not in decided:
+                    appearance[field] = output
+                    decided.add(field)
+
+        return appearance
+
+    def get_appearances(self) -> List[dict]:
+        # every appearance resolve() can return, as far as it can be known without the attribute values
+        base = list(self._states.values()) + [self._default]
+        appearances = list(base)
+
+        for rule in self._attribute_rules:
+            outputs = [{"color": color} for color in rule["colors"]] if "colors" in rule else rule["outputs"]
+
+            appearances += [{**appearance, **output} for appearance in base for output in outputs]
+
+        return appearances
+
+
+def compile_rules(domain: str, service: str, button_rules: List[dict] = None) -> CompiledRules:
+    rules = [
+        rule
+        for rule in (button_rules or []) + DEFAULT_RULES.get(domain, []) + DEFAULT_RULES["*"]
+        if rule.get("service", service) == service
+    ]
+
+    plain_rules = [rule for rule in rules if "attribute" not in rule]
+
+    states = {
+        state: _merge([rule for rule in plain_rules if rule.get("state", state) == state])
+        for state in {rule["state"] for rule in plain_rules if "state" in rule}
+    }
+
+    default = _merge([rule for rule in plain_rules if "state" not in rule])
+
+    return CompiledRules(states, default, _compile_attribute_rules([rule for rule in rules if "attribute" in rule]))
+
+
+def parse_rules(value: str) -> List[dict]:
+    if not value:
+        return []
+
+    try:
+        rules = json.loads(value)
+    except json.JSONDecodeError:
+        _LOGGER.error(f"Could not parse icon rules {value}")
+        return []
+
+    if not isinstance(rules, list):
+        _LOGGER.error(f"Icon rules must be a JSON list of objects: {value}")
+        return []
+
+    valid_rules = []
+
+    for rule in rules:
+        error = _validate_rule(rule)
+
+        if error:
+            _LOGGER.error(f"Ignoring icon rule {rule}: {error}")
+            continue
+
+        valid_rules.append(rule)
+
+    return valid_rules
+
+
+def _validate_rule(rule) -> str:
+    if not isinstance(rule, dict):
+        return "a rule must be an object"
+
+    for field in ("service", "state", "icon", "color", "text"):
+        if field in rule and not isinstance(rule[field], str):
+            return f"'{field}' must be a string"
+
+    if "mode" in rule and rule["mode"] not in (MODE_ICON, MODE_TEXT):
+        return f"'mode' must be '{MODE_ICON}' or '{MODE_TEXT}'"
+
+    for field in ("below", "min", "max"):
+        if field in rule and not _is_number(rule[field]):
+            return f"'{field}' must be a number"
+
+    if "gradient" in rule and (
+            not isinstance(rule["gradient"], list)
+            or not rule["gradient"]
+            or not all(isinstance(color, str) and HEX_COLOR.fullmatch(color) for color in rule["gradient"])
+    ):
+        return "'gradient' must be a non-empty list of hex colors like #fff or #eeff1b"
+
+    if "attribute" in rule:
+        if not isinstance(rule["attribute"], str):
+            return "'attribute' must be a string"
+
+        if "below" not in rule and "gradient" not in rule:
+            return "an attribute rule needs 'below' or 'gradient'"
+    elif any(field in rule for field in ("below", "min", "max", "gradient")):
+        return "'below', 'min', 'max' and 'gradient' need an 'attribute'"
+
+    return ""
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def render_text(template: str, state: str, attributes: dict) -> str:
+    unit_of_measurement = attributes.get("unit_of_measurement", "")
+
+    if unit_of_measurement:
+        unit_of_measurement = f"\n{unit_of_measurement}"
+
+    try:
+        return template.format_map({**attributes, "state": state, "unit": unit_of_measurement})
+    except (KeyError, ValueError, IndexError, AttributeError, TypeError):
+        return f"{state}{unit_of_measurement}"
+
+
+def _merge(rules: List[dict]) -> dict:
+    appearance = {}
+
+    for rule in rules:
+        for field in OUTPUT_FIELDS:
+            if field in rule and field not in appearance:
+                appearance[field] = rule[field]
+
+    return appearance
+
+
+def _compile_attribute_rules(rules: List[dict]) -> List[dict]:
+    compiled = []
+
+    # consecutive "below" rules for the same attribute and state become one threshold lookup
+    for rule in rules:
+        if "gradient" in rule:
+            compiled.append({
+                "attribute": rule["attribute"],
+                "state": rule.get("state"),
+                "min": rule.get("min", 0),
+                "max": rule.get("max", 100),
+                "colors": _compile_gradient(rule["gradient"]),
+            })
+            continue
+
+        outputs = {field: rule[field] for field in OUTPUT_FIELDS if field in rule}
+
+        previous = compiled[-1] if compiled else None
+
+        if (
+                previous
+                and "thresholds" in previous
+                and previous["attribute"] == rule["attribute"]
+                and previous["state"] == rule.get("state")
+                and previous["thresholds"][-1] < rule["below"]
+        ):
+            previous["thresholds"].append(rule["below"])
+            previous["outputs"].append(outputs)
+            continue
+
+        compiled.append({
+            "attribute": rule["attribute"],
+            "state": rule.get("state"),
+            "thresholds": [rule["below"]],
+            "outputs": [outputs],
+        })
+
+    # a value below a threshold is below all higher ones as well, so their rules match too; fields the
+    # first matching rule leaves open are taken from the later ones
+    for rule in compiled:
+        if "thresholds" in rule:
+            for index in range(len(rule["outputs"]) - 2, -1, -1):
+                rule["outputs"][index] = {**rule["outputs"][index + 1], **rule["outputs"][index]}
+
+    return compiled
+
+
+def _compile_gradient(colors: List[str]) -> List[str]:
+    colors = [_expand_color(color) for color in colors]
+
+    rgb = [tuple(int(color[i:i + 2], 16) for i in (0, 2, 4)) for color in colors]
+
+    if len(rgb) == 1:
+        return [f"#{colors[0]}"] * GRADIENT_STEPS
+
+    steps = []
+
+    for step in range(GRADIENT_STEPS):
+        position = step / (GRADIENT_STEPS - 1) * (len(rgb) - 1)
+        index = min(int(position), len(rgb) - 2)
+        fraction = position - index
+        start, end = rgb[index], rgb[index + 1]
+
+        steps.append("#" + "".join(f"{round(a + (b - a) * fraction):02x}" for a, b in zip(start, end)))
+
+    return steps
+
+
+def _expand_color(color: str) -> str:
+    # shorthand colors like #fff become ffffff
+    color = color.lstrip("#")
+
+    return color if len(color) == 6 else "".join(digit * 2 for digit in color)
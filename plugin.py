@@ -40,11 +40,7 @@ def apply_button_settings(deck_id: str, page_id: int, button_id: int, button_set
 
 
 def button_pressed(button_settings: Dict[str, str]) -> None:
-    entity = button_settings.get("entity")
-    service = button_settings.get("service")
-
-    if entity and service:
-        INSTANCE.call_service(entity, service)
+    INSTANCE.press_button(button_settings)
 
 
 def initialize(api: StreamDeckServer, settings: Dict[str, str]) -> None:
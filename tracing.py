@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from logging import getLogger
+from typing import Dict, List
+
+_LOGGER = getLogger(__name__)
+
+# oldest events are dropped beyond this, so a forgotten trace can not eat up memory
+MAX_TRACE_EVENTS = 200000
+
+# presses still waiting for a state event after this long (in microseconds) are ended, e.g. nothing changed
+MAX_PRESS_DURATION = 30 * 1000000
+
+_NO_SPAN = nullcontext()
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled: bool = False
+        self._events = deque(maxlen=MAX_TRACE_EVENTS)
+        self._pending_presses: Dict[str, List[int]] = {}
+        self._press_starts: Dict[int, int] = {}
+        self._pending_presses_lock = threading.Lock()
+        self._press_id: int = 0
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        self._events.clear()
+
+        with self._pending_presses_lock:
+            self._pending_presses.clear()
+            self._press_starts.clear()
+
+    def span(self, name: str, **args):
+        if not self.enabled:
+            return _NO_SPAN
+
+        return self._span(name, args)
+
+    @contextmanager
+    def _span(self, name: str, args: dict):
+        start = _now()
+
+        try:
+            yield
+        finally:
+            self._add({"name": name, "ph": "X", "ts": start, "dur": _now() - start, "args": args})
+
+    def add_span(self, name: str, start: int, **args) -> None:
+        # for spans which started outside of this process, e.g. in Home Assistant; they end now
+        if not self.enabled:
+            return
+
+        duration = _now() - start
+
+        if duration < 0:
+            # the other clock is ahead of ours, the span would be meaningless
+            return
+
+        self._add({"name": name, "ph": "X", "ts": start, "dur": duration, "args": args})
+
+    def start_press(self, entity_ids: List[str], **args) -> int:
+        if not self.enabled:
+            return 0
+
+        now = _now()
+
+        with self._pending_presses_lock:
+            timed_out = self._drop_presses(
+                [press_id for press_id, start in self._press_starts.items() if now - start > MAX_PRESS_DURATION]
+            )
+
+            self._press_id += 1
+            press_id = self._press_id
+            self._press_starts[press_id] = now
+
+            # a press is shown as one async span from the key press to the first state event of a target entity
+            for entity_id in entity_ids:
+                self._pending_presses.setdefault(entity_id, []).append(press_id)
+
+        self._end_presses(timed_out, {"timeout": True})
+
+        self._add({"name": "press", "cat": "press", "ph": "b", "id": press_id, "ts": now, "args": args})
+
+        return press_id
+
+    def press_step(self, press_id: int, name: str) -> None:
+        if self.enabled and press_id:
+            self._add({"name": "press", "cat": "press", "ph": "n", "id": press_id, "ts": _now(), "args": {"step": name}})
+
+    def ack_press(self, press_id: int) -> None:
+        if not self.enabled or not press_id:
+            return
+
+        with self._pending_presses_lock:
+            if any(press_id in pending for pending in self._pending_presses.values()):
+                # a state event of a target entity ends it
+                return
+
+            # no target entity to wait for, e.g. only areas or devices, so the press ends with its acknowledgement
+            press_ids = self._drop_presses([press_id])
+
+        self._end_presses(press_ids, {"ack": True})
+
+    def end_presses(self, entity_id: str) -> None:
+        if not self.enabled:
+            return
+
+        with self._pending_presses_lock:
+            press_ids = self._drop_presses(self._pending_presses.pop(entity_id, []))
+
+        self._end_presses(press_ids, {"state_event": entity_id})
+
+    def _drop_presses(self, press_ids: List[int]) -> List[int]:
+        # presses already ended are left out, so a press is never ended twice
+        press_ids = [press_id for press_id in press_ids if self._press_starts.pop(press_id, None) is not None]
+
+        for entity_id, pending in list(self._pending_presses.items()):
+            pending[:] = [press_id for press_id in pending if press_id not in press_ids]
+
+            if not pending:
+                del self._pending_presses[entity_id]
+
+        return press_ids
+
+    def _end_presses(self, press_ids: List[int], args: dict) -> None:
+        for press_id in press_ids:
+            self._add({"name": "press", "cat": "press", "ph": "e", "id": press_id, "ts": _now(), "args": args})
+
+    def export(self, filename: str) -> None:
+        events = list(self._events)
+
+        try:
+            with open(os.path.expanduser(filename), "w") as file:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        except OSError as error:
+            _LOGGER.error(f"Could not write trace to {filename}: {error}")
+            return
+
+        _LOGGER.info(f"Wrote {len(events)} trace events to {filename}")
+
+    def _add(self, event: dict) -> None:
+        event["pid"] = os.getpid()
+        event["tid"] = threading.get_ident()
+        self._events.append(event)
+
+
+def _now() -> int:
+    # microseconds since the epoch, so Home Assistant timestamps can be put on the same time line
+    return time.time_ns() // 1000
+
+
+def timestamp_to_trace_time(timestamp: str) -> int | None:
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000000)
+    except (TypeError, ValueError):
+        return None
+
+
+TRACER = Tracer()
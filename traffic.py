@@ -0,0 +1,75 @@
+from typing import Dict, List, Sequence
+
+from websockets.extensions import Extension
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
+from websockets.frames import DATA_OPCODES, Frame
+
+
+class TrafficCounter:
+    def __init__(self):
+        self.compression: bool = False
+        self.sent: int = 0
+        self.received: int = 0
+        self.sent_compressed: int = 0
+        self.received_compressed: int = 0
+
+    def count_sent(self, message: str) -> None:
+        self.sent += len(message.encode())
+
+    def count_received(self, message: str | bytes) -> None:
+        self.received += len(message) if isinstance(message, bytes) else len(message.encode())
+
+    def get_stats(self) -> Dict[str, int | bool]:
+        return {
+            "compression": self.compression,
+            "sent": self.sent,
+            "received": self.received,
+            # without compression the payload goes over the wire as it is
+            "sent_compressed": self.sent_compressed if self.compression else self.sent,
+            "received_compressed": self.received_compressed if self.compression else self.received,
+        }
+
+
+class _CountingExtension(Extension):
+    def __init__(self, extension: Extension, counter: TrafficCounter):
+        self._extension = extension
+        self._counter = counter
+
+    @property
+    def name(self):
+        return self._extension.name
+
+    def decode(self, frame: Frame, *, max_size: int | None = None) -> Frame:
+        if frame.opcode in DATA_OPCODES:
+            self._counter.received_compressed += len(frame.data)
+
+        return self._extension.decode(frame, max_size=max_size)
+
+    def encode(self, frame: Frame) -> Frame:
+        frame = self._extension.encode(frame)
+
+        if frame.opcode in DATA_OPCODES:
+            self._counter.sent_compressed += len(frame.data)
+
+        return frame
+
+
+class CountingPerMessageDeflateFactory(ClientPerMessageDeflateFactory):
+    def __init__(self, counter: TrafficCounter, compression_level: int = -1):
+        # same settings websockets uses for compression="deflate", apart from the configurable level
+        super().__init__(client_max_window_bits=True, compress_settings={"level": compression_level, "memLevel": 5})
+        self._counter = counter
+
+    def process_response_params(self, params: Sequence, accepted_extensions: Sequence[Extension]) -> Extension:
+        extension = super().process_response_params(params, accepted_extensions)
+        self._counter.compression = True
+
+        return _CountingExtension(extension, self._counter)
+
+
+def get_extensions(counter: TrafficCounter, compression: bool, compression_level: int) -> List | None:
+    if not compression:
+        # an empty list would still send an empty extensions header, which servers reject
+        return None
+
+    return [CountingPerMessageDeflateFactory(counter, compression_level)]